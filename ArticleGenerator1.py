@@ -1,171 +1,581 @@
-import traceback
+import asyncio
+import hashlib
+import shelve
+import threading
+import time
 import requests
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import os
 import json
 import warnings
 import io
-from datetime import datetime, timedelta
-from crewai import Agent, Task, Crew
-from docx import Document
-from docx.shared import Pt
-from docx import Document as DocxDocument  # Import for reading Word documents
-from langchain.chat_models import AzureChatOpenAI
-import openai
+import re
+import zlib
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# orjson is optional; the stdlib json module is used when it is not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Suppress warnings
 warnings.filterwarnings('ignore')
 
-# Helper function to load and save configurations
-def load_config():
+CONFIG_PATH = "agent_task_config.json"
+
+# Persistent response cache shared by all sessions. Entries hold transcripts, plans and
+# drafts, so expired ones are deleted rather than kept on disk
+CACHE_PATH = ".article_cache"
+CACHE_TTL = 86400  # seconds
+CACHE_PRUNE_INTERVAL = 3600  # seconds
+CACHE_PRUNE_KEY = "__last_prune__"
+cache_lock = threading.Lock()
+
+# In-memory st.cache_data entries are bounded and expire like the persistent cache
+DATA_CACHE_ENTRIES = 64
+
+# Helper functions to load and save configurations; the parsed file is cached on its
+# modification time so reruns only pay for a stat call
+def config_mtime():
     try:
-        with open("agent_task_config.json", "r") as f:
-            return json.load(f)
+        return os.path.getmtime(CONFIG_PATH)
     except FileNotFoundError:
+        return None
+
+@st.cache_data(show_spinner=False)
+def read_config(mtime):
+    if mtime is None:
         return {}
+    with open(CONFIG_PATH, "rb") as f:
+        data = f.read()
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def load_config():
+    return read_config(config_mtime())
 
 def save_config(config):
-    with open("agent_task_config.json", "w") as f:
-        json.dump(config, f)
+    # Write a temporary file and rename it so readers never see a partial config
+    tmp_path = CONFIG_PATH + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps(config) if orjson else json.dumps(config).encode("utf-8"))
+    os.replace(tmp_path, CONFIG_PATH)
+    read_config.clear()
+
+W_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+# Function to read content from a Word document, cached on the file bytes across reruns.
+# The text is taken straight from word/document.xml instead of building python-docx's object
+# model. Like paragraph.text it covers the runs of each top-level body paragraph, and run
+# content (text, tabs, breaks, non-breaking hyphens) maps to text as in python-docx's CT_R.text
+@st.cache_data(show_spinner=False, max_entries=DATA_CACHE_ENTRIES, ttl=CACHE_TTL)
+def read_docx_bytes(raw):
+    from lxml import etree
+
+    with zipfile.ZipFile(io.BytesIO(raw)) as archive:
+        root = etree.fromstring(archive.read("word/document.xml"))
+    ns = {"w": W_NAMESPACE}
+    run_content = etree.XPath(
+        "(w:r | w:hyperlink/w:r)/*[self::w:t or self::w:tab or self::w:ptab or self::w:br or self::w:cr"
+        " or self::w:noBreakHyphen]",
+        namespaces=ns
+    )
+    paragraphs = []
+    for paragraph in root.find("w:body", ns).iterfind("w:p", ns):
+        parts = []
+        for elem in run_content(paragraph):
+            name = etree.QName(elem).localname
+            if name == "t":
+                parts.append(elem.text or "")
+            elif name in ("tab", "ptab"):
+                parts.append("\t")
+            elif name == "noBreakHyphen":
+                parts.append("-")
+            elif name == "cr" or elem.get(f"{{{W_NAMESPACE}}}type", "textWrapping") == "textWrapping":
+                # Page and column breaks carry no text
+                parts.append("\n")
+        paragraphs.append("".join(parts))
+    return "\n".join(paragraphs)
+
+@st.cache_data(show_spinner=False, max_entries=DATA_CACHE_ENTRIES, ttl=CACHE_TTL)
+def decode_txt(raw):
+    return raw.decode("utf-8")
+
+# Fingerprint an upload by its bytes; BLAKE2 is faster than SHA-256 and in the stdlib
+def file_digest(raw):
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+# Parse a single upload according to its file extension; browsers report inconsistent MIME
+# types, while the uploader already restricts the extensions
+def parse_upload(name, raw):
+    extension = os.path.splitext(name)[1].lower()
+    if extension == ".txt":
+        return decode_txt(raw)
+    elif extension == ".docx":
+        return read_docx_bytes(raw)
+    raise ValueError(f"Unsupported file type for {name}; upload TXT or Word (.docx) files.")
+
+# Parse the uploads into labelled per-file contents and their concatenation. Files whose
+# bytes repeat an earlier upload are included once, and parsed_files maps digests to texts
+# already parsed in this session so they are not parsed again
+def build_contents(uploaded_files, parsed_files):
+    uploads = []
+    seen = set()
+    for uploaded_file in uploaded_files:
+        raw = uploaded_file.getvalue()
+        digest = file_digest(raw)
+        if digest not in seen:
+            seen.add(digest)
+            uploads.append((digest, uploaded_file.name, raw))
+
+    # Parse the new uploads concurrently; workers get the script context so the
+    # st.cache_data parsers can run outside the script thread
+    pending = [upload for upload in uploads if upload[0] not in parsed_files]
+    if pending:
+        with ThreadPoolExecutor(
+            max_workers=min(max_parallel, len(pending)),
+            initializer=add_script_run_ctx,
+            initargs=(None, get_script_run_ctx())
+        ) as executor:
+            digests, names, raws = zip(*pending)
+            parsed_files.update(zip(digests, executor.map(parse_upload, names, raws)))
+
+    # Only keep the texts of the current uploads
+    for digest in list(parsed_files):
+        if digest not in seen:
+            del parsed_files[digest]
+
+    per_file_contents = []
+    parts = []
+    for i, (digest, name, _) in enumerate(uploads, 1):
+        label = f"--- File {i}: {name} ---"
+        per_file_contents.append((label, parsed_files[digest]))
+        parts.append(f"{label}\n")
+        parts.append(parsed_files[digest])
+        parts.append("\n\n")
+    return per_file_contents, "".join(parts)
+
+# Long texts are kept zlib-compressed in the session state and only decompressed when used
+def compress_text(text):
+    return zlib.compress(text.encode("utf-8"), 3)
+
+def decompress_text(data):
+    return zlib.decompress(data).decode("utf-8")
+
+# Render the compressed report as a Word document; cached so reruns do not rebuild the same file
+@st.cache_data(show_spinner=False, max_entries=DATA_CACHE_ENTRIES, ttl=CACHE_TTL)
+def build_report_docx(report_zlib):
+    from docx import Document
+    from docx.shared import Pt
+
+    report = decompress_text(report_zlib)
+    doc = Document()
+    # Paragraphs inherit the Normal style, so its font size only needs setting once
+    doc.styles['Normal'].font.size = Pt(11)
+    doc.add_paragraph("Industry Insights Report", style='Heading 1')
+    for line in report.split('\n'):
+        doc.add_paragraph(line.strip())
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+STREAM_RENDER_INTERVAL = 0.1  # seconds
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+# One streaming handler for the process. It routes tokens into the container bound by the
+# current thread, so sessions never share a container and planner worker threads, which
+# never bind one, are not rendered. The class is built here so langchain is only imported
+# once a client is needed
+@st.cache_resource
+def get_stream_handler():
+    from langchain.callbacks.base import BaseCallbackHandler
+
+    class StreamHandler(BaseCallbackHandler):
+        def __init__(self):
+            self.local = threading.local()
+
+        def bind(self, container):
+            self.local.container = container
+            self.local.tokens = deque()
+            self.local.rendered_at = 0.0
+
+        def unbind(self):
+            self.local.container = None
+
+        # Agents answer in crewai's ReAct format, so only the text after "Final Answer:" is shown
+        def render(self):
+            text = "".join(self.local.tokens)
+            if FINAL_ANSWER_MARKER in text:
+                self.local.container.markdown(text.split(FINAL_ANSWER_MARKER, 1)[1].lstrip())
+            self.local.rendered_at = time.monotonic()
+
+        # Re-rendering sends the whole text so far, so it is throttled to STREAM_RENDER_INTERVAL
+        def on_llm_new_token(self, token, **kwargs):
+            if getattr(self.local, "container", None) is not None:
+                self.local.tokens.append(token)
+                if time.monotonic() - self.local.rendered_at >= STREAM_RENDER_INTERVAL:
+                    self.render()
+
+        def on_llm_end(self, response, **kwargs):
+            if getattr(self.local, "container", None) is not None:
+                self.render()
+
+    return StreamHandler()
+
+# Pooled HTTP session factory for openai. The SDK keeps one session per thread and replaces
+# it every few minutes, so each thread gets its own pool that keeps TCP/TLS connections alive
+def make_http_session():
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount("https://", adapter)
+    return session
+
+# Hash the API key so it is never used as a cache key itself
+def api_key_digest(api_key):
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+# Build each chat client once per key, deployment and temperature and reuse it across reruns;
+# the raw key is passed as _api_key so it is excluded from the cache key
+@st.cache_resource(show_spinner=False, max_entries=16)
+def get_llm(api_key_hash, _api_key, deployment, temperature, streaming=False):
+    from langchain.chat_models import AzureChatOpenAI
+
+    return AzureChatOpenAI(
+        openai_api_key=_api_key,
+        openai_api_base=azure_api_base,
+        openai_api_version=azure_api_version,
+        deployment_name=deployment,
+        openai_api_type="azure",
+        temperature=temperature,
+        streaming=streaming,
+        callbacks=[get_stream_handler()] if streaming else None
+    )
 
-# Function to read content from a Word document
-def read_docx(file):
-    doc = DocxDocument(file)
-    return "\n".join([paragraph.text for paragraph in doc.paragraphs])
+# Build a stable cache key from everything that determines an LLM response
+def cache_key(*parts):
+    return hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()
+
+# Look up a cached response, deleting it when it is older than CACHE_TTL
+def cache_get(key):
+    with cache_lock, shelve.open(CACHE_PATH) as cache:
+        entry = cache.get(key)
+        if entry is not None and time.time() - entry[0] > CACHE_TTL:
+            del cache[key]
+            entry = None
+    return None if entry is None else entry[1]
+
+# Store a response; at most once per CACHE_PRUNE_INTERVAL this also deletes every expired
+# entry, so entries that are never read again do not accumulate
+def cache_set(key, value):
+    now = time.time()
+    with cache_lock, shelve.open(CACHE_PATH) as cache:
+        cache[key] = (now, value)
+        if now - cache.get(CACHE_PRUNE_KEY, 0) > CACHE_PRUNE_INTERVAL:
+            for cached_key in list(cache.keys()):
+                if cached_key != CACHE_PRUNE_KEY and now - cache[cached_key][0] > CACHE_TTL:
+                    del cache[cached_key]
+            cache[CACHE_PRUNE_KEY] = now
+
+# Assemble a task description as step instructions followed by the variable material
+def task_description(instructions, material):
+    return f"{instructions}\n\n{material}"
+
+# Build the agents once per client, keyed like get_llm; the unhashable client itself is
+# excluded from hashing. The agents are shared by every session and thread, so they keep no
+# conversation memory and run_task calls them statelessly
+@st.cache_resource(show_spinner=False, max_entries=16)
+def make_agents(api_key_hash, deployment, temperature, _llm):
+    from crewai import Agent
+
+    planner = Agent(
+        role="Content Planner",
+        goal="Plan content based on transcripts.",
+        backstory="Plan a structured research article.",
+        llm=_llm,
+        allow_delegation=False,
+        verbose=True,
+        memory=False,
+        temperature=temperature
+    )
+
+    writer = Agent(
+        role="Content Writer",
+        goal="Write a cohesive article based on the plan.",
+        backstory="Write a polished research article.",
+        llm=_llm,
+        allow_delegation=False,
+        verbose=True,
+        memory=False,
+        temperature=temperature
+    )
+
+    editor = Agent(
+        role="Editor",
+        goal="Edit and refine the research article.",
+        backstory="Finalize the research article for publication.",
+        llm=_llm,
+        allow_delegation=False,
+        verbose=True,
+        memory=False,
+        temperature=temperature
+    )
+    return planner, writer, editor
+
+# Run a single agent task, reusing the cached output for an identical agent prompt and input.
+# The agent's executor is invoked directly with an empty chat history: the agents have no
+# memory to fill that prompt input, and each call must stay independent of every other call
+# since concurrent planner workers and all sessions share the same agents
+def run_task(agent, description, temperature):
+    key = cache_key(deployment_name, temperature, agent.role, agent.goal, agent.backstory, description)
+    output = cache_get(key)
+    if output is None:
+        output = agent.agent_executor.invoke({
+            "input": description,
+            "tools": "",
+            "tool_names": "",
+            "chat_history": "",
+        })["output"]
+        cache_set(key, output)
+    return output
+
+# Independent editing passes over the draft; each returns revision notes for the editor
+EDIT_PASSES = {
+    "Grammar Editor": "Review the research article below for grammar, spelling and punctuation. "
+                      "List each correction as the original sentence followed by the corrected one.",
+    "Citation Editor": "Review the research article below for claims, figures and quotes that lack an attribution "
+                       "to a speaker or transcript. List each one with the attribution to add.",
+    "Tone Editor": "Review the research article below for tone and consistency with a professional research "
+                   "publication. List each passage to change with a suggested rewrite.",
+}
+
+# Run one editing pass, reusing the cached notes for an identical prompt and draft
+async def run_edit_pass(llm, role, instructions, draft, temperature):
+    key = cache_key(deployment_name, temperature, role, instructions, draft)
+    notes = cache_get(key)
+    if notes is None:
+        notes = await llm.apredict(task_description(instructions, draft))
+        cache_set(key, notes)
+    return notes
+
+# The editing passes only depend on the draft, so they are dispatched concurrently
+async def run_edit_passes(llm, draft, temperature):
+    notes = await asyncio.gather(*(
+        run_edit_pass(llm, role, instructions, draft, temperature)
+        for role, instructions in EDIT_PASSES.items()
+    ))
+    return dict(zip(EDIT_PASSES, notes))
+
+# Combine the draft with the notes of every editing pass into the editor's material
+def editor_material(draft, edit_notes):
+    notes = "\n\n".join(f"{role} notes:\n{role_notes}" for role, role_notes in edit_notes.items())
+    return f"{draft}\n\n{notes}"
+
+# Summarize an oversized transcript chunk by chunk with the cheaper deployment, falling back
+# to the main deployment when the cheaper one is unavailable
+def summarize_transcript(summary_llm, fallback_llm, content):
+    summaries = []
+    for start in range(0, len(content), summary_chunk_chars):
+        chunk = content[start:start + summary_chunk_chars]
+        key = cache_key(summary_deployment_name, "Transcript Summarizer", chunk)
+        summary = cache_get(key)
+        if summary is None:
+            prompt = task_description(
+                "Summarize this transcript excerpt, keeping the speakers, key claims, figures and notable quotes.",
+                chunk
+            )
+            try:
+                summary = summary_llm.predict(prompt)
+            except Exception:
+                summary = fallback_llm.predict(prompt)
+            cache_set(key, summary)
+        summaries.append(summary)
+    return "\n\n".join(summaries)
+
+# Run a single planning task for one transcript, planning from a summary when it is oversized
+def plan_transcript(planner, summary_llm, fallback_llm, temperature, label, content):
+    if len(content) > summary_threshold:
+        content = summarize_transcript(summary_llm, fallback_llm, content)
+    description = task_description("Plan content for the following transcript.", f"{label}\n{content}")
+    return run_task(planner, description, temperature)
+
+# Plan every transcript concurrently, returning the plans in upload order
+def plan_transcripts(planner, summary_llm, fallback_llm, temperature, per_file_contents, max_parallel, timeout):
+    plans = [None] * len(per_file_contents)
+    executor = ThreadPoolExecutor(max_workers=min(max_parallel, len(per_file_contents)))
+    try:
+        futures = {
+            executor.submit(plan_transcript, planner, summary_llm, fallback_llm, temperature, label, content): i
+            for i, (label, content) in enumerate(per_file_contents)
+        }
+        for future in as_completed(futures, timeout=timeout):
+            plans[futures[future]] = future.result()
+    finally:
+        # Do not block on stragglers once the timeout has been hit
+        executor.shutdown(wait=False, cancel_futures=True)
+    return plans
+
+# Pick the transcript paragraphs sharing the most terms with the plan, kept in transcript order
+def retrieve_excerpts(plan, content, budget):
+    terms = set(re.findall(r"\w{4,}", plan.lower()))
+    paragraphs = [paragraph for paragraph in content.split("\n") if paragraph.strip()]
+    scores = [len(terms.intersection(re.findall(r"\w{4,}", paragraph.lower()))) for paragraph in paragraphs]
+    selected = []
+    used = 0
+    for i in sorted(range(len(paragraphs)), key=lambda i: scores[i], reverse=True):
+        if scores[i] == 0:
+            break
+        if used + len(paragraphs[i]) <= budget:
+            selected.append(i)
+            used += len(paragraphs[i])
+    return "\n".join(paragraphs[i] for i in sorted(selected))
+
+# Combine the plans into the writer's material; summarized transcripts also contribute the
+# original paragraphs most relevant to their plan so the writer keeps the full detail
+def writer_material(per_file_contents, plans):
+    sections = []
+    for (label, content), plan in zip(per_file_contents, plans):
+        section = f"{label}\n{plan}"
+        if len(content) > summary_threshold:
+            section += f"\n\nRelevant transcript excerpts:\n{retrieve_excerpts(plan, content, excerpt_chars)}"
+        sections.append(section)
+    return "\n\n".join(sections)
 
 # Load persisted configurations at startup
 config = load_config()
 
+# Planner fan-out settings (overridable in agent_task_config.json)
+max_parallel = config.get("max_parallel", 8)
+planner_timeout = config.get("planner_timeout", 600)
+
+# Transcripts longer than summary_threshold characters are summarized before planning
+summary_threshold = config.get("summary_threshold", 24000)
+summary_chunk_chars = config.get("summary_chunk_chars", 12000)
+excerpt_chars = config.get("excerpt_chars", 6000)
+summary_deployment_name = config.get("summary_deployment_name", "gpt-35-turbo")
+
 # Streamlit UI
 st.title("Research Article Generator")
 
-# Azure OpenAI API inputs
-azure_api_key = st.text_input("Enter your Azure OpenAI API Key", type="password")
+# Azure OpenAI API settings
 azure_api_base = "https://rstapestryopenai2.openai.azure.com/"
 azure_api_version = "2024-02-15-preview"
 deployment_name = "gpt-4"
 
+# Inputs are grouped in a form so editing them does not rerun the script until submitted
+with st.form("gen_form"):
+    # Azure OpenAI API key
+    azure_api_key = st.text_input("Enter your Azure OpenAI API Key", type="password")
+
+    # File uploader to accept both .txt and .docx files
+    uploaded_files = st.file_uploader("Upload one or more transcript files (TXT or Word)", type=["txt", "docx"], accept_multiple_files=True)
+
+    # Temperature slider
+    temperature = st.slider("Set the temperature for the output (0 = deterministic, 1 = creative)", min_value=0.0, max_value=1.0, value=0.7)
+
+    # Button to start processing
+    submitted = st.form_submit_button("Generate Research Article")
+
 # Initialize Azure OpenAI instance
 if azure_api_key:
     try:
+        import openai
+
+        stream_handler = get_stream_handler()
         openai.api_key = azure_api_key
         openai.api_base = azure_api_base
+        openai.requestssession = make_http_session
+
+        api_key_hash = api_key_digest(azure_api_key)
+        llm = get_llm(api_key_hash, azure_api_key, deployment_name, temperature, streaming=True)
+
+        # Non-streaming client for the concurrent editing passes, whose output is not displayed
+        edit_llm = get_llm(api_key_hash, azure_api_key, deployment_name, temperature)
 
-        llm = AzureChatOpenAI(
-            openai_api_key=azure_api_key,
-            openai_api_base=azure_api_base,
-            openai_api_version=azure_api_version,
-            deployment_name=deployment_name,
-            openai_api_type="azure",
-            temperature=0.7  # Default temperature
-        )
+        # Cheaper deployment used only to summarize oversized transcripts
+        summary_llm = get_llm(api_key_hash, azure_api_key, summary_deployment_name, 0.0)
         st.success("Azure OpenAI API connection successful!")
     except Exception as e:
         st.error(f"Error connecting to Azure OpenAI API: {str(e)}")
 else:
     st.warning("Please enter your Azure OpenAI API Key.")
 
-# File uploader to accept both .txt and .docx files
-uploaded_files = st.file_uploader("Upload one or more transcript files (TXT or Word)", type=["txt", "docx"], accept_multiple_files=True)
-
-# Temperature slider
-temperature = st.slider("Set the temperature for the output (0 = deterministic, 1 = creative)", min_value=0.0, max_value=1.0, value=0.7)
-
 # Initialize session state variables
-if 'combined_content' not in st.session_state:
-    st.session_state['combined_content'] = ""
-if 'final_report' not in st.session_state:
-    st.session_state['final_report'] = ""
+if 'final_report_zlib' not in st.session_state:
+    st.session_state['final_report_zlib'] = b""
+if 'parsed_files' not in st.session_state:
+    st.session_state['parsed_files'] = {}
 
-# Button to start processing
-if st.button("Generate Research Article"):
+# Process the submitted form
+if submitted:
     if not uploaded_files:
         st.error("Please upload at least one transcript file.")
     elif not azure_api_key:
         st.error("Please enter your Azure OpenAI API Key.")
     else:
-        # Process files
-        st.session_state['combined_content'] = ""
-        for i, uploaded_file in enumerate(uploaded_files, 1):
-            if uploaded_file.type == "text/plain":
-                file_content = uploaded_file.read().decode("utf-8")
-            elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                file_content = read_docx(uploaded_file)
-
-            st.session_state['combined_content'] += f"--- File {i}: {uploaded_file.name} ---\n"
-            st.session_state['combined_content'] += file_content + "\n\n"
-
-        # Ensure combined content is not empty
-        if st.session_state['combined_content']:
-            try:
-                # Define agents and tasks
-                planner = Agent(
-                    role="Content Planner",
-                    goal="Plan content based on transcripts.",
-                    backstory="Plan a structured research article.",
-                    llm=llm,
-                    allow_delegation=False,
-                    verbose=True,
-                    temperature=temperature
-                )
+        try:
+            # Process files
+            per_file_contents, combined_content = build_contents(uploaded_files, st.session_state['parsed_files'])
 
-                writer = Agent(
-                    role="Content Writer",
-                    goal="Write a cohesive article based on the plan.",
-                    backstory="Write a polished research article.",
-                    llm=llm,
-                    allow_delegation=False,
-                    verbose=True,
-                    temperature=temperature
-                )
+            # Ensure combined content is not empty
+            if not combined_content:
+                st.error("No content to process.")
+            else:
+                # Define agents
+                planner, writer, editor = make_agents(api_key_hash, deployment_name, temperature, llm)
 
-                editor = Agent(
-                    role="Editor",
-                    goal="Edit and refine the research article.",
-                    backstory="Finalize the research article for publication.",
-                    llm=llm,
-                    allow_delegation=False,
-                    verbose=True,
-                    temperature=temperature
+                # Generate report, skipping the whole pipeline for an identical earlier run
+                # with the same summarization settings
+                run_key = cache_key(
+                    deployment_name, temperature, summary_deployment_name,
+                    summary_threshold, summary_chunk_chars, excerpt_chars, combined_content
                 )
+                cached_run = cache_get(run_key)
+                if cached_run is not None:
+                    result = cached_run['report']
+                else:
+                    # Each transcript is planned independently, so fan the planner out across files
+                    with st.status("Planning...") as status:
+                        plans = plan_transcripts(planner, summary_llm, edit_llm, temperature, per_file_contents, max_parallel, planner_timeout)
+                        combined_plan = writer_material(per_file_contents, plans)
+                        status.update(label="Planning complete", state="complete")
 
-                # Define tasks
-                plan = Task(description="Plan content for the given transcripts.", agent=planner)
-                write = Task(description="Write a research article based on the content plan.", agent=writer)
-                edit = Task(description="Edit and finalize the research article.", agent=editor)
+                    # Writer and editor depend on the previous step, so they run one after another
+                    # and stream their output into their own status containers
+                    try:
+                        with st.status("Writing...", expanded=True) as status:
+                            stream_handler.bind(st.empty())
+                            draft = run_task(writer, task_description("Write a research article based on the content plans below.", combined_plan), temperature)
+                            status.update(label="Draft written", state="complete", expanded=False)
 
-                # Crew to manage agents and tasks
-                crew = Crew(agents=[planner, writer, editor], tasks=[plan, write, edit], verbose=True)
+                        # The grammar, citation and tone passes run concurrently over the draft,
+                        # then the editor applies their notes in one final pass
+                        with st.status("Editing...", expanded=True) as status:
+                            edit_notes = asyncio.run(run_edit_passes(edit_llm, draft, temperature))
+                            stream_handler.bind(st.empty())
+                            result = run_task(editor, task_description("Apply the revision notes below to the research article and return the finalized article.", editor_material(draft, edit_notes)), temperature)
+                            status.update(label="Editing complete", state="complete", expanded=False)
+                    finally:
+                        stream_handler.unbind()
 
-                # Generate report
-                with st.spinner("Generating research article... This may take a few minutes."):
-                    result = crew.kickoff()
+                    cache_set(run_key, {'plans': plans, 'draft': draft, 'edit_notes': edit_notes, 'report': result})
 
                 # Display the final report
-                st.session_state['final_report'] = result
+                st.session_state['final_report_zlib'] = compress_text(result)
                 st.success("Research article generated successfully!")
                 st.markdown(result)
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
-                st.error(traceback.format_exc())
-        else:
-            st.error("No content to process.")
-
-# Buttons to download the combined content and final report
-if st.session_state['final_report']:
-    doc = Document()
-    doc.add_paragraph("Industry Insights Report", style='Heading 1')
-    for line in st.session_state['final_report'].split('\n'):
-        p = doc.add_paragraph(line.strip())
-        p.style.font.size = Pt(11)
-
-    buffer = io.BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
+        except Exception as e:
+            st.error("Error generating the research article.")
+            st.exception(e)
 
+# Button to download the final report
+if st.session_state['final_report_zlib']:
     st.download_button(
         label="Download Final Report",
-        data=buffer.getvalue(),
+        data=build_report_docx(st.session_state['final_report_zlib']),
         file_name="research_article.docx",
         mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
     )